@@ -1,6 +1,9 @@
 import click
 import polars as pl
 
+from workflow.scripts.event_filters import event_filter, junction_id_o, read_gencode_introns
+from workflow.scripts.intermediate_io import IPC_COMPRESSIONS, read_table, write_table
+
 
 def get_stats(df):
     return (
@@ -10,49 +13,14 @@ def get_stats(df):
     )
 
 
-def read_gencode_introns(dfa):
-    dft = dfa.filter((pl.col('feature') == 'transcript') & (pl.col('transcript_type') == "protein_coding"))['transcript_id']
-    dfa2 = dfa\
-        .filter(
-            (pl.col('feature') == 'exon') & 
-            pl.col('transcript_id').is_in(dft))\
-        .sort(by=['transcript_id', 'start'])\
-        .with_columns(
-            pl.col("start").shift(-1).over("transcript_id").alias("coord_next"),
-            pl.col("end").shift(1).over("transcript_id").alias("coord_prev"),
-            pl.col('exon_number').cast(pl.Int16)
-        )\
-        .with_columns(
-            (pl.col('seqname') + "_" + pl.col('end').cast(str) + "_" + pl.col('coord_next').cast(str) + "_" + pl.col('strand') + "_").alias('intron_r')
-        )
-
-    return dfa2['intron_r']
-
-
-
 @click.command()
 @click.option("--input", required=True)
 @click.option("--annotation-pq", required=True)
+@click.option("--annotated-right-only/--all-right", default=True)
+@click.option("--protein-coding-introns/--all-introns", default=True)
 @click.option("--output", required=True)
-def main(input, annotation_pq, output):
-    df1 = pl.read_parquet(input, use_pyarrow=True)\
-        .with_columns(
-        (pl.col('seqname') + "_" + pl.col('coord_prev').cast(str) + "_" + 
-         pl.col('coord_next').cast(str) + "_" + pl.col('strand') + "_").alias('junction_id_o')
-    )
-    dfa = pl.read_parquet(annotation_pq)
-    dfi = read_gencode_introns(dfa)
-
-    print("Initial statistics:")
-    print(get_stats(df1))
-
-    df1 = df1.filter(
-        pl.col("is_annotated_right") & 
-        (pl.col('junction_id_o').is_in(dfi) | pl.col('event_type').is_in(['AR', 'AL']))
-    )
-    print("After removal of non-annotated pairs and non-coding transcripts:")
-    print(get_stats(df1))
-
+@click.option("--ipc-compression", type=click.Choice(IPC_COMPRESSIONS), default="uncompressed")
+def main(input, annotation_pq, annotated_right_only, protein_coding_introns, output, ipc_compression):
     columns_groupby = [
         "exon_id",
         "seqname",
@@ -78,6 +46,22 @@ def main(input, annotation_pq, output):
         "end_right",
     ]
 
+    # only the columns used here are read from S6_merged
+    df1 = read_table(
+        input,
+        columns=[*columns_groupby, *[c for c in columns_aggregate if c != "junction_id_o"]],
+    ).with_columns(junction_id_o())
+    dfa = pl.read_parquet(annotation_pq)
+    dfi = read_gencode_introns(dfa) if protein_coding_introns else None
+
+    print("Initial statistics:")
+    print(get_stats(df1))
+
+    # no-op when the filters were already applied per sample by filter_exons
+    df1 = df1.filter(event_filter(dfi, annotated_right_only))
+    print("After removal of non-annotated pairs and non-coding transcripts:")
+    print(get_stats(df1))
+
     df2 = (
         df1.sort(by="ipsa_min")
         .groupby(columns_groupby)
@@ -102,7 +86,7 @@ def main(input, annotation_pq, output):
     print("After aggregating right elements:")
     print(get_stats(df2))
 
-    df2.write_parquet(output)
+    write_table(df2, output, ipc_compression)
 
 
 if __name__ == "__main__":
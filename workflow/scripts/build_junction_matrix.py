@@ -0,0 +1,28 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import polars as pl
+
+from workflow.scripts.filter_exons import parse_ipsa
+from workflow.scripts.junction_matrix import build_matrix, write_matrix
+
+
+@click.command()
+@click.option("--input-list", required=True)
+@click.option("--output-dir", required=True)
+@click.option("--threads", default=1)
+def main(input_list, output_dir, threads):
+    file_list = pl.read_csv(
+        input_list, separator="\t", has_header=False, new_columns=["sample_name", "path"]
+    )
+    # polars releases the GIL while parsing, so the J6 files are read in parallel
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        frames = list(executor.map(parse_ipsa, file_list["path"]))
+
+    junctions, samples, counts = build_matrix(file_list["sample_name"].to_list(), frames)
+    print(f"Junctions: {junctions.shape[0]}; samples: {samples.shape[0]}; non-zero counts: {counts.shape[0]}")
+    write_matrix((junctions, samples, counts), output_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,19 @@ import polars as pl
 from scipy.stats import ecdf
 from tqdm import tqdm
 
+from workflow.scripts.intermediate_io import IPC_COMPRESSIONS, TableWriter, read_table
+from workflow.scripts.quantile_sketch import (
+    DEFAULT_ALPHA,
+    REFERENCE_GROUPS,
+    add_meta,
+    build_sketch,
+    evaluate_cdf,
+    reference_sketch,
+    sketch_groups,
+)
+
+SHARED_METRICS = ["ipsa_min", "cov"]
+
 
 def get_eventtype_stats(df):
     return df["event_type"].value_counts()
@@ -18,33 +31,39 @@ def get_unique_event_stats(df):
     )
 
 
-def xor(b1, b2):
-    return b1 != b2
+def event_type_as():
+    # convert event_type from AL, AR to 3'AS, 5'AS according to the strand
+    return (
+        pl.when(pl.col("event_type") == "CE")
+        .then(pl.lit("CE"))
+        .when((pl.col("strand") == "+") != (pl.col("event_type") == "AR"))
+        .then(pl.lit("3'AS"))
+        .otherwise(pl.lit("5'AS"))
+        .alias("event_type")
+    )
 
 
-def map_event_type(r):
-    if r[5] == "CE":
-        return "CE"
-    if xor((r[4] == "+"), (r[5] == "AR")):
-        return "3'AS"
-    else:
-        return "5'AS"
+def cons_columns(tracks):
+    # a single track keeps the cons_avg column of the single-track tables
+    if len(tracks) <= 1:
+        return ["cons_avg"]
+    return [f"cons_avg_{t}" for t in tracks]
 
 
-@click.command()
-@click.option("--input-pq", required=True)
-@click.option("--input-bed", required=True)
-@click.option("--max-as-length", default=150)
-@click.option("--output", required=True)
-def main(input_pq, input_bed, max_as_length, output):
+def ecdf_metrics(tracks):
+    return [*cons_columns(tracks), *SHARED_METRICS]
+
+
+def read_bed(input_bed, tracks):
+    cons_cols = cons_columns(tracks)
     input_bed_columns = [
         "seqname",
         "start",
         "end",
         "exon_id",
         "event_type",
-        "cons_wmean",
-        "cons_cov",
+        "radius",
+        *[c for k in cons_cols for c in (f"{k}_wmean", f"{k}_cov")],
     ]
     dfc1 = pl.read_csv(
         input_bed,
@@ -53,32 +72,29 @@ def main(input_pq, input_bed, max_as_length, output):
         has_header=False,
         new_columns=input_bed_columns,
     )
+    radii = dfc1["radius"].unique().sort().to_list()
     print(f"Number of unique events in BED:")
     print(get_eventtype_stats(dfc1))
 
+    # events have to be scored in every track
     dfc1 = dfc1.with_columns(
-        (pl.col("cons_wmean") * pl.col("cons_cov")).alias("cons_avg")
-    ).filter(~pl.col("cons_avg").is_nan())
+        (pl.col(f"{k}_wmean") * pl.col(f"{k}_cov")).alias(k) for k in cons_cols
+    ).filter(pl.all_horizontal([~pl.col(k).is_nan() for k in cons_cols]))
     print(f"Number of unique events in BED after removing non-conserved:")
     print(get_eventtype_stats(dfc1))
+    return dfc1, radii
 
-    dfc1 = dfc1.filter(
-        ~(
-            (pl.col("event_type").is_in(["AL", "AR"]))
-            & ((pl.col("end") - pl.col("start") > max_as_length))
-        )
-    )
-    print(
-        f"Number of unique events in BED after removing AS longer than {max_as_length}:"
-    )
-    print(get_eventtype_stats(dfc1))
-
-    df2 = pl.read_parquet(input_pq, use_pyarrow=True)
-    print(f"Number of unique events in full dataset:")
-    print(get_unique_event_stats(df2))
 
+def select_events(df2, dfc1, cons_cols):
+    # events of one radius with the length of their BED interval, which is
+    # used by the AS length filter of every max_as_length
     df2 = df2.join(
-        dfc1.select("exon_id", "event_type", "cons_avg"),
+        dfc1.select(
+            "exon_id",
+            "event_type",
+            *cons_cols,
+            (pl.col("end") - pl.col("start")).alias("bed_length"),
+        ),
         on=["exon_id", "event_type"],
     )
     print(f"Number of unique events in full dataset after merge with BED data:")
@@ -88,17 +104,64 @@ def main(input_pq, input_bed, max_as_length, output):
     print(f"Number of unique events in BED after removing elements with cov = NaN:")
     print(get_unique_event_stats(df2))
 
-    # convert event_type from AL, AR to A3, A5
-    df2 = df2.with_columns(
-        df2.map_rows(map_event_type).get_columns()[-1].alias("event_type")
-    )
+    df2 = df2.with_columns(event_type_as())
     print(f"Number of unique events after conversion to 5'|3' AS notation:")
     print(get_unique_event_stats(df2))
+    return df2
+
+
+def with_params(df, params):
+    return df.with_columns(
+        pl.lit(v, dtype=pl.Int64).alias(k) for k, v in params.items()
+    )
+
+
+def iter_events(input_pq, input_bed, max_as_lengths, tracks):
+    # S7 and the BED with all radii are read once and shared by every
+    # (radius, max_as_length) combination; the parameters are added as
+    # columns when more than one combination is requested, and are yielded
+    # with the events of every combination. CE events do not
+    # depend on max_as_length, so they are yielded with the first length of
+    # each radius only and are None for the other lengths
+    dfc1, radii = read_bed(input_bed, tracks)
+
+    df2 = read_table(input_pq)
+    print(f"Number of unique events in full dataset:")
+    print(get_unique_event_stats(df2))
+
+    sweep = len(radii) * len(max_as_lengths) > 1
+    for radius in radii:
+        print(f"Radius {radius}:")
+        events = select_events(
+            df2, dfc1.filter(pl.col("radius") == radius), cons_columns(tracks)
+        )
+        is_ce = pl.col("event_type") == "CE"
+        ce_events = events.filter(is_ce).drop("bed_length")
+        for max_as_length in max_as_lengths:
+            combination = {"radius": radius, "max_as_length": max_as_length}
+            params = combination if sweep else {}
+            as_events = events.filter(
+                ~is_ce & (pl.col("bed_length") <= max_as_length)
+            ).drop("bed_length")
+            print(f"Number of unique AS events after removing AS longer than {max_as_length}:")
+            print(get_unique_event_stats(as_events))
+            yield (
+                combination,
+                params,
+                with_params(ce_events, params) if max_as_length == max_as_lengths[0] else None,
+                with_params(as_events, params),
+            )
 
+
+def add_exact_ecdfs(df2, metrics):
+    if df2.is_empty():
+        return df2.with_columns(
+            pl.lit(None, dtype=pl.Float64).alias(f"{k}_ann_cdf") for k in metrics
+        )
     dfs = []
     for n, df in tqdm(df2.group_by(["sample_name", "event_type"], maintain_order=True)):
         dfm1_known = df.filter(pl.col("is_annotated"))
-        ecdfs = {k: ecdf(dfm1_known[k].view()) for k in ["cons_avg", "ipsa_min", "cov"]}
+        ecdfs = {k: ecdf(dfm1_known[k].view()) for k in metrics}
 
         res = df.with_columns(
             [
@@ -109,14 +172,127 @@ def main(input_pq, input_bed, max_as_length, output):
             ]
         )
         # res = res.with_columns(df2[f'{k}_ann_cdf'] = np.round(v.cdf.evaluate(df2[k].view()), decimals=4))
-        res = res.with_columns(
-            pl.min_horizontal([f"{k}_ann_cdf" for k in ecdfs.keys()]).alias(
-                "ann_cdf_min"
+        dfs.append(res)
+    return pl.concat(dfs)
+
+
+def match_sketch(sketch, combination, params):
+    # rows of a sketch of a previous run for the given parameter combination
+    for k, v in combination.items():
+        if k in sketch.columns:
+            sketch = sketch.filter(pl.col(k) == v)
+            if k not in params:
+                sketch = sketch.drop(k)
+        elif k in params:
+            raise ValueError(
+                f"A reference sketch without {k} cannot be used in a parameter sweep"
             )
+    return sketch
+
+
+def add_sketch_ecdfs(
+    df2, combination, params, metrics, alpha, reference_by, extra_sketches, meta_df
+):
+    # the sketch of this run is built from the same events that are evaluated,
+    # and merged with the sketches of previous runs into the reference
+    sketch = build_sketch(
+        df2.filter(pl.col("is_annotated")),
+        by=[*params, "sample_name", "event_type"],
+        metrics=metrics,
+        alpha=alpha,
+    )
+    extra = [match_sketch(s, combination, params) for s in extra_sketches]
+    ref = reference_sketch([sketch, *extra], reference_by, meta_df, list(params))
+
+    if "meta" in sketch_groups(ref):
+        df2 = add_meta(df2, meta_df)
+    res = evaluate_cdf(df2, ref, metrics)
+    res = res.drop("meta") if "meta" in sketch_groups(ref) else res
+    return res, sketch
+
+
+@click.command()
+@click.option("--input-pq", required=True)
+@click.option("--input-bed", required=True)
+@click.option("--max-as-length", "max_as_lengths", default=[150], multiple=True)
+@click.option("--track", "tracks", multiple=True)
+@click.option("--ecdf-mode", type=click.Choice(["exact", "sketch"]), default="exact")
+@click.option("--alpha", default=DEFAULT_ALPHA)
+@click.option("--reference-by", type=click.Choice(list(REFERENCE_GROUPS)), default="sample")
+@click.option("--reference-sketch", "reference_sketches", multiple=True)
+@click.option("--input-meta", default=None)
+@click.option("--output", required=True)
+@click.option("--output-sketch", default=None)
+@click.option("--ipc-compression", type=click.Choice(IPC_COMPRESSIONS), default="uncompressed")
+def main(
+    input_pq,
+    input_bed,
+    max_as_lengths,
+    tracks,
+    ecdf_mode,
+    alpha,
+    reference_by,
+    reference_sketches,
+    input_meta,
+    output,
+    output_sketch,
+    ipc_compression,
+):
+    metrics = ecdf_metrics(tracks)
+    # samples of this run replace their sketches from previous runs, so that
+    # they are not counted twice in meta and cohort references
+    extra_sketches = []
+    if reference_sketches:
+        run_samples = read_table(input_pq, columns=["sample_name"])["sample_name"].unique()
+        extra_sketches = [
+            pl.read_parquet(f).filter(~pl.col("sample_name").is_in(run_samples))
+            for f in reference_sketches
+        ]
+    meta_df = (
+        pl.read_csv(input_meta).select(pl.col("name").alias("sample_name"), "meta")
+        if input_meta is not None
+        else None
+    )
+
+    def add_ecdfs(df2, combination, params):
+        if ecdf_mode == "exact":
+            return add_exact_ecdfs(df2, metrics), None
+        return add_sketch_ecdfs(
+            df2,
+            combination,
+            params,
+            metrics,
+            alpha,
+            reference_by,
+            extra_sketches,
+            meta_df,
         )
-        dfs.append(res)
 
-    pl.concat(dfs).write_parquet(output, use_pyarrow=True)
+    # every combination is written as soon as it is computed
+    sketches = []
+    with TableWriter(output, ipc_compression) as writer:
+        for combination, params, ce_events, as_events in iter_events(
+            input_pq, input_bed, max_as_lengths, tracks
+        ):
+            if ce_events is not None:
+                ce = add_ecdfs(ce_events, combination, params)
+            else:
+                # CE eCDFs of the first max_as_length of this radius
+                ce = [with_params(df, params) if df is not None else None for df in ce]
+            res, sketch = add_ecdfs(as_events, combination, params)
+            sketches += [ce[1], sketch]
+
+            # one ann_cdf_min per track, sharing the ipsa_min and cov eCDFs
+            writer.write(
+                pl.concat([ce[0], res]).with_columns(
+                    pl.min_horizontal(
+                        [f"{c}_ann_cdf" for c in [k, *SHARED_METRICS]]
+                    ).alias(k.replace("cons_avg", "ann_cdf_min"))
+                    for k in cons_columns(tracks)
+                )
+            )
+    if output_sketch is not None:
+        pl.concat(sketches).write_parquet(output_sketch)
 
 
 if __name__ == "__main__":
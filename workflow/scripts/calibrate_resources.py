@@ -0,0 +1,78 @@
+from pathlib import Path
+
+import click
+import numpy as np
+import polars as pl
+from scipy.optimize import nnls
+
+# Fits mem_mb = mem_mb_base + mem_mb_per_input_mb * input_mb
+# + mem_mb_per_sample * samples for each rule from Snakemake benchmark files
+# (benchmarks/{rule}.tsv or benchmarks/{rule}/*.tsv). input_mb and samples are
+# the values used by rule_mem_mb in the Snakefile, recorded by every job in
+# {benchmark}.inputs next to the benchmark file.
+
+MODEL_VARIABLES = {"input_mb": "mem_mb_per_input_mb", "samples": "mem_mb_per_sample"}
+
+
+def read_benchmarks(benchmark_dirs):
+    dfs = []
+    for d in benchmark_dirs:
+        for f in Path(d).rglob("*.tsv"):
+            inputs = f.with_name(f.name + ".inputs")
+            if not inputs.exists():
+                print(f"# skipped {f}: no {inputs.name}")
+                continue
+            rel = f.relative_to(d)
+            rule = rel.parts[0] if len(rel.parts) > 1 else f.stem
+            dfs.append(
+                pl.concat(
+                    [
+                        pl.read_csv(f, separator="\t").select("max_rss"),
+                        pl.read_csv(inputs, separator="\t").select(*MODEL_VARIABLES),
+                    ],
+                    how="horizontal",
+                ).with_columns(pl.lit(rule).alias("rule"))
+            )
+    return (
+        pl.concat(dfs)
+        .with_columns(
+            pl.col(["max_rss", *MODEL_VARIABLES]).cast(pl.Float64, strict=False)
+        )
+        .drop_nulls()
+    )
+
+
+def fit_rule(df, headroom):
+    # non-negative least squares over the variables that vary between runs;
+    # the others get a zero coefficient and are absorbed by mem_mb_base
+    variables = [k for k in MODEL_VARIABLES if df[k].n_unique() > 1]
+    coefs = dict.fromkeys(MODEL_VARIABLES, 0.0)
+    if variables:
+        X = np.column_stack([np.ones(df.shape[0]), df.select(variables).to_numpy()])
+        fit, _ = nnls(X, df["max_rss"].to_numpy())
+        coefs.update(zip(variables, fit[1:]))
+    # shift the intercept so that the model covers every recorded run
+    intercept = (
+        df["max_rss"] - sum(v * df[k] for k, v in coefs.items())
+    ).max()
+    return dict(
+        mem_mb_base=int(max(intercept, 0) * headroom),
+        **{MODEL_VARIABLES[k]: round(v * headroom, 2) for k, v in coefs.items()},
+    )
+
+
+@click.command()
+@click.option("--benchmark-dir", "benchmark_dirs", required=True, multiple=True)
+@click.option("--headroom", default=1.2)
+def main(benchmark_dirs, headroom):
+    df = read_benchmarks(benchmark_dirs)
+    print("resources:")
+    for rule in df["rule"].unique(maintain_order=True):
+        dfr = df.filter(pl.col("rule") == rule)
+        print(f"  {rule}:  # {dfr.shape[0]} runs")
+        for k, v in fit_rule(dfr, headroom).items():
+            print(f"    {k}: {v}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+import polars as pl
+
+# Exon-level event filters shared by filter_exons (per sample, S6) and
+# aggregate_right_elements (S7). They do not depend on the right element chosen
+# by the aggregation, so they can be applied per sample. The AS length filter
+# depends on that choice and stays in calculate_eCDF.
+
+
+def read_gencode_introns(dfa):
+    dft = dfa.filter((pl.col('feature') == 'transcript') & (pl.col('transcript_type') == "protein_coding"))['transcript_id']
+    dfa2 = dfa\
+        .filter(
+            (pl.col('feature') == 'exon') & 
+            pl.col('transcript_id').is_in(dft))\
+        .sort(by=['transcript_id', 'start'])\
+        .with_columns(
+            pl.col("start").shift(-1).over("transcript_id").alias("coord_next"),
+            pl.col("end").shift(1).over("transcript_id").alias("coord_prev"),
+            pl.col('exon_number').cast(pl.Int16)
+        )\
+        .with_columns(
+            (pl.col('seqname') + "_" + pl.col('end').cast(str) + "_" + pl.col('coord_next').cast(str) + "_" + pl.col('strand') + "_").alias('intron_r')
+        )
+
+    return dfa2['intron_r']
+
+
+def junction_id_o():
+    return (
+        pl.col('seqname') + "_" + pl.col('coord_prev').cast(str) + "_" +
+        pl.col('coord_next').cast(str) + "_" + pl.col('strand') + "_"
+    ).alias('junction_id_o')
+
+
+def event_filter(pc_introns=None, annotated_right_only=True):
+    expr = ~pl.col("cov").is_nan()
+    if annotated_right_only:
+        expr = expr & pl.col("is_annotated_right")
+    if pc_introns is not None:
+        expr = expr & (
+            junction_id_o().is_in(pc_introns) | pl.col('event_type').is_in(['AR', 'AL'])
+        )
+    return expr
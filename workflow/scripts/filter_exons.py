@@ -3,6 +3,9 @@ import gzip
 import click
 import polars as pl
 
+from workflow.scripts.event_filters import event_filter, read_gencode_introns
+from workflow.scripts.junction_matrix import sample_counts
+
 REQUIRED_COLUMNS = [
     "seqname",
     "source",
@@ -179,8 +182,7 @@ def find_events(df6, df6_introns):
     return pl.concat([df7_ce, df7_al, df7_ar], how="diagonal")
 
 
-def parse_gencode_table(gencode_parquet):
-    df_anno_full = pl.read_parquet(gencode_parquet)
+def parse_gencode_table(df_anno_full):
     df_anno_full2 = df_anno_full.filter(pl.col("feature") == "exon")
     df_anno_full2 = df_anno_full2.sort(by=["seqname", "start"]).with_columns(
         pl.col("end").shift(1).over("transcript_id").alias("coord_prev"),
@@ -196,12 +198,29 @@ def parse_gencode_table(gencode_parquet):
 
 @click.command()
 @click.option("--stringtie-gtf", required=True)
-@click.option("--ipsa-junctions", required=True)
+@click.option("--ipsa-junctions", default=None)
+@click.option("--junction-matrix", default=None)
 @click.option("--annotation-gtf", required=True)
 @click.option("--output", required=True)
 @click.option("--sample-name", required=True)
-def main(stringtie_gtf, ipsa_junctions, annotation_gtf, output, sample_name):
-    anno_exons, anno_introns = parse_gencode_table(annotation_gtf)
+@click.option("--annotated-right-only/--all-right", default=True)
+@click.option("--protein-coding-introns/--all-introns", default=True)
+def main(
+    stringtie_gtf,
+    ipsa_junctions,
+    junction_matrix,
+    annotation_gtf,
+    output,
+    sample_name,
+    annotated_right_only,
+    protein_coding_introns,
+):
+    if (ipsa_junctions is None) == (junction_matrix is None):
+        raise click.UsageError(
+            "Exactly one of --ipsa-junctions and --junction-matrix is required"
+        )
+    dfa = pl.read_parquet(annotation_gtf)
+    anno_exons, anno_introns = parse_gencode_table(dfa)
 
     df1 = parse_gtf(stringtie_gtf)
     df1 = df1.with_columns(
@@ -211,7 +230,10 @@ def main(stringtie_gtf, ipsa_junctions, annotation_gtf, output, sample_name):
     df2 = get_exons_from_gtf(df1)
     print(df2.head())
     df3 = aggregate_exons_by_transcripts(df2, anno_exons)
-    dfj2 = parse_ipsa(ipsa_junctions)
+    if junction_matrix is not None:
+        dfj2 = sample_counts(junction_matrix, sample_name)
+    else:
+        dfj2 = parse_ipsa(ipsa_junctions)
 
     introns_df = (
         df3.select(["seqname", "end", "coord_next", "strand"])
@@ -225,6 +247,10 @@ def main(stringtie_gtf, ipsa_junctions, annotation_gtf, output, sample_name):
     df7 = find_events(df6, introns_df).with_columns(
         pl.lit(sample_name).alias("sample_name")
     )
+    dfi = read_gencode_introns(dfa) if protein_coding_introns else None
+    print(f"Events before filtering: {df7.shape[0]}")
+    df7 = df7.filter(event_filter(dfi, annotated_right_only))
+    print(f"Events after filtering: {df7.shape[0]}")
 
     with gzip.open(output, "wb") as f:
         df7.write_csv(f, separator="\t")
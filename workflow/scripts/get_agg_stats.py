@@ -1,110 +1,78 @@
 import click
-import numpy as np
 import polars as pl
-from scipy.stats import ecdf
-from tqdm import tqdm
 
+from workflow.scripts.intermediate_io import PARAM_COLUMNS, scan_table
+from workflow.scripts.quantile_sketch import DEFAULT_ALPHA, build_sketch, sketch_quantile
 
-def get_eventtype_stats(df):
-    return df["event_type"].value_counts()
+GROUP_COLUMNS = ["exon_id", "event_type", "is_annotated"]
+SHARED_METRICS = ["ipsa_min", "cov"]
 
 
-def get_unique_event_stats(df):
-    return (
-        df.select(["event_type", "exon_id"])
-        .unique()
-        .group_by("event_type")
-        .agg(pl.col("exon_id").count())
-    )
-
-
-def xor(b1, b2):
-    return b1 != b2
-
-
-def map_event_type(r):
-    if r[5] == "CE":
-        return "CE"
-    if xor((r[4] == "+"), (r[5] == "AR")):
-        return "3'AS"
-    else:
-        return "5'AS"
-
-
-@click.command()
-@click.option("--input-pq", required=True)
-@click.option("--input-bed", required=True)
-@click.option("--max-as-length", default=150)
-@click.option("--output", required=True)
-def main(input_pq, input_bed, max_as_length, output):
-    input_bed_columns = [
-        "seqname",
-        "start",
-        "end",
-        "exon_id",
-        "event_type",
-        "ann_bp",
-        "ann_frac",
-        "cons_wmean",
-        "cons_cov",
-        "pc_gene_ind",
-    ]
-    dfc1 = pl.read_csv(
-        input_bed,
-        separator="\t",
-        use_pyarrow=True,
-        has_header=False,
-        new_columns=input_bed_columns,
-    )
-    print(f"Number of unique events in BED:")
-    print(get_eventtype_stats(dfc1))
-
-    dfc1 = dfc1.with_columns(
-        (pl.col("cons_wmean") * pl.col("cons_cov")).alias("cons_avg")
-    ).filter(~pl.col("cons_avg").is_nan())
-    print(f"Number of unique events in BED after removing non-conserved:")
-    print(get_eventtype_stats(dfc1))
+def per_sample(lf, by, metrics):
+    # S9 has one row per BED interval of an event, AL/AR events of a sample
+    # may have several; every sample is counted once with its mean values
+    return lf.group_by([*by, "sample_name"]).agg(pl.col(x).mean() for x in metrics)
 
-    dfc1 = dfc1.filter(pl.col("pc_gene_ind") == 1).drop("pc_gene_ind")
-    print(f"Number of unique events in BED after removing non-protein-coding:")
-    print(get_eventtype_stats(dfc1))
 
-    dfc1 = dfc1.filter(
-        ~(
-            (pl.col("event_type").is_in(["AL", "AR"]))
-            & ((pl.col("end") - pl.col("start") > max_as_length))
+def exact_summary(lf, by, metrics):
+    # median() is not supported by the streaming engine of polars 0.19.3, so
+    # this group-by runs in memory on the per-sample rows
+    return (
+        per_sample(lf, by, metrics)
+        .group_by(by)
+        .agg(
+            pl.count().alias("sample_count"),
+            *[pl.col(x).median() for x in metrics],
         )
+        .collect(streaming=True)
     )
-    print(
-        f"Number of unique events in BED after removing AS longer than {max_as_length}:"
-    )
-    print(get_eventtype_stats(dfc1))
 
-    df2 = pl.read_parquet(input_pq, use_pyarrow=True)
-    print(f"Number of unique events in full dataset:")
-    print(get_unique_event_stats(df2))
 
-    df2 = df2.join(
-        dfc1.select("exon_id", "event_type", "cons_avg", "ann_frac"),
-        on=["exon_id", "event_type"],
+def approx_summary(lf, by, metrics, alpha):
+    # medians within relative error alpha from per-group quantile sketches,
+    # built by a streaming group-by with one row per group, metric and bucket;
+    # samples are counted as a constant pseudo-metric in the same pass
+    sketch = build_sketch(
+        per_sample(lf, by, metrics).with_columns(pl.lit(0.0).alias("sample_count")),
+        by,
+        [*metrics, "sample_count"],
+        alpha,
+    ).collect(streaming=True)
+    counts = (
+        sketch.filter(pl.col("metric") == "sample_count")
+        .group_by(by)
+        .agg(pl.sum("count").cast(pl.UInt32).alias("sample_count"))
     )
-    print(f"Number of unique events in full dataset after merge with BED data:")
-    print(get_unique_event_stats(df2))
+    medians = sketch_quantile(
+        sketch.filter(pl.col("metric") != "sample_count"), 0.5
+    ).pivot(values="value", index=by, columns="metric")
+    return counts.join(medians, on=by, how="left")
 
-    df2 = df2.filter(~pl.col("cov").is_nan())
-    print(f"Number of unique events in BED after removing elements with cov = NaN:")
-    print(get_unique_event_stats(df2))
 
-    # convert event_type from AL, AR to A3, A5
-    df2 = df2.with_columns(
-        df2.map_rows(map_event_type).get_columns()[-1].alias("event_type")
+@click.command()
+@click.option("--input", "inputs", required=True, multiple=True)
+@click.option("--median", type=click.Choice(["exact", "approx"]), default="exact")
+@click.option("--alpha", default=DEFAULT_ALPHA)
+@click.option("--output", required=True)
+def main(inputs, median, alpha, output):
+    # tables of a parameter sweep are summarized for each combination
+    columns = scan_table(inputs[0]).columns
+    by = [c for c in PARAM_COLUMNS if c in columns] + GROUP_COLUMNS
+    # cons_avg, or one cons_avg_{track} column per conservation track
+    metrics = [
+        c for c in columns if c.startswith("cons_avg") and not c.endswith("_ann_cdf")
+    ] + SHARED_METRICS
+    lf = pl.concat(
+        [scan_table(f).select(*by, "sample_name", *metrics) for f in inputs]
     )
-    print(f"Number of unique events after conversion to 5'|3' AS notation:")
-    print(get_unique_event_stats(df2))
 
-    
-    df3 = df2.group_by(['exon_id', 'event_type', 'is_annotated'])\
-        .agg(pl.col(x).median() for x in ["cons_avg", "ipsa_min", "cov"])
+    df3 = (
+        exact_summary(lf, by, metrics)
+        if median == "exact"
+        else approx_summary(lf, by, metrics, alpha)
+    ).select(*by, "sample_count", *metrics).sort(by)
+    print("Number of exons by event type:")
+    print(df3.group_by(["event_type", "is_annotated"]).agg(pl.count()))
 
     df3.write_parquet(output, use_pyarrow=True)
 
@@ -1,37 +1,60 @@
 import click
 import polars as pl
 
+from workflow.scripts.intermediate_io import is_ipc, scan_table
+
 
 @click.command()
 @click.option("--input", required=True)
 @click.option("--output", required=True)
-@click.option("--radius", default=1)
-def main(input, output, radius):
-    df2 = pl.scan_parquet(input)
+@click.option("--radius", "radii", default=[1], multiple=True)
+@click.option("--max-as-length", default=None, type=int)
+def main(input, output, radii, max_as_length):
+    df2 = scan_table(input)
+    # S9 tables of a parameter sweep carry the radius of each row
+    radius_column = ["radius"] if "radius" in df2.columns else []
     dfnr1 = (
         df2.filter(pl.col("event_type") == "CE")
-        .select("seqname", "start", "end", "exon_id", "event_type")
+        .select("seqname", "start", "end", "exon_id", "event_type", *radius_column)
         .unique()
     )
     dfnr2 = (
         df2.filter(pl.col("event_type") == "AL")
-        .select("seqname", "start", "start_right", "exon_id", "event_type")
+        .select("seqname", "start", "start_right", "exon_id", "event_type", *radius_column)
         .unique()
         .with_columns(pl.col("start_right").cast(pl.Int64))
     )
     dfnr2 = dfnr2.rename({"start_right": "end"})
     dfnr3 = (
         df2.filter(pl.col("event_type") == "AR")
-        .select("seqname", "end_right", "end", "exon_id", "event_type")
+        .select("seqname", "end_right", "end", "exon_id", "event_type", *radius_column)
         .unique()
         .with_columns(pl.col("end_right").cast(pl.Int64))
     )
     dfnr3 = dfnr3.rename({"end_right": "start"})
 
     dfnr = pl.concat([dfnr1, dfnr2, dfnr3])
-    dfnr = dfnr.with_columns(pl.col("start") - radius - 1, pl.col("end") + radius)
+    if not radius_column:
+        # one row per radius, all radii are scored in a single bedmap pass
+        dfnr = pl.concat(
+            [dfnr.with_columns(pl.lit(r, dtype=pl.Int64).alias("radius")) for r in radii]
+        )
+    dfnr = dfnr.with_columns(
+        pl.col("start") - pl.col("radius") - 1, pl.col("end") + pl.col("radius")
+    )
+    if max_as_length is not None:
+        # AS intervals longer than every max_as_length, flanks included, are
+        # removed by calculate_eCDF and need not be scored
+        dfnr = dfnr.filter(
+            ~pl.col("event_type").is_in(["AL", "AR"])
+            | (pl.col("end") - pl.col("start") <= max_as_length)
+        )
 
-    dfnr.sink_csv(output, has_header=False, separator="\t")
+    if is_ipc(input):
+        # sink_csv over a memory-mapped IPC scan panics in polars 0.19.3
+        dfnr.collect().write_csv(output, has_header=False, separator="\t")
+    else:
+        dfnr.sink_csv(output, has_header=False, separator="\t")
 
 
 if __name__ == "__main__":
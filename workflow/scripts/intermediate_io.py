@@ -0,0 +1,71 @@
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Intermediate tables (S6_merged, S7, S9) are parquet or Arrow IPC files, chosen
+# by the file extension. Uncompressed IPC files are memory-mapped, so columns
+# that are not requested are not read and repeated reads are served from the
+# page cache; LZ4-compressed IPC files are smaller but have to be decoded on
+# every read.
+
+IPC_SUFFIXES = (".arrow", ".ipc", ".feather")
+IPC_COMPRESSIONS = ["uncompressed", "lz4"]
+# columns identifying the parameter combination of the rows of a sweep
+PARAM_COLUMNS = ["radius", "max_as_length"]
+
+
+def is_ipc(path):
+    return str(path).endswith(IPC_SUFFIXES)
+
+
+def read_table(path, columns=None):
+    if is_ipc(path):
+        return pl.read_ipc(path, columns=columns, memory_map=True)
+    return pl.read_parquet(path, columns=columns, use_pyarrow=True)
+
+
+def scan_table(path):
+    if is_ipc(path):
+        return pl.scan_ipc(path, memory_map=True)
+    return pl.scan_parquet(path)
+
+
+def write_table(df, path, ipc_compression="uncompressed", use_pyarrow=False):
+    if is_ipc(path):
+        df.write_ipc(path, compression=ipc_compression)
+    else:
+        df.write_parquet(path, use_pyarrow=use_pyarrow)
+
+
+class TableWriter:
+    # writes a table in chunks with pyarrow, so that the whole table does not
+    # have to be held in memory; chunks are cast to the schema of the first one
+    def __init__(self, path, ipc_compression="uncompressed"):
+        self.path = path
+        self.ipc_compression = ipc_compression
+        self.writer = None
+
+    def write(self, df):
+        table = df.to_arrow()
+        if self.writer is None:
+            self.schema = table.schema
+            if is_ipc(self.path):
+                options = pa.ipc.IpcWriteOptions(
+                    compression=None
+                    if self.ipc_compression == "uncompressed"
+                    else self.ipc_compression
+                )
+                self.writer = pa.ipc.new_file(self.path, self.schema, options=options)
+            else:
+                self.writer = pq.ParquetWriter(self.path, self.schema, compression="zstd")
+        self.writer.write_table(table.select(self.schema.names).cast(self.schema))
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,114 @@
+import os
+
+import click
+import polars as pl
+from scipy.sparse import csc_matrix
+
+# Cohort-wide junction x sample count matrix in COO form, stored as three
+# parquet files in one directory:
+#   junctions.pq  junction_idx, junction_id
+#   samples.pq    sample_idx, sample_name
+#   counts.pq     sample_idx, junction_idx, total_count sorted by sample, so that
+#                 the counts of one sample are a contiguous slice (CSC order)
+#   counts_by_junction.pq
+#                 the same counts sorted by junction (CSR order), so that the
+#                 row groups of other junctions are skipped by their statistics
+
+JUNCTIONS = "junctions.pq"
+SAMPLES = "samples.pq"
+COUNTS = "counts.pq"
+COUNTS_BY_JUNCTION = "counts_by_junction.pq"
+
+
+def build_matrix(sample_names, frames):
+    samples = pl.DataFrame({"sample_name": sample_names}).with_row_count("sample_idx")
+    long = pl.concat(
+        [
+            df.with_columns(pl.lit(i, dtype=pl.UInt32).alias("sample_idx"))
+            for i, df in enumerate(frames)
+        ]
+    )
+    junctions = (
+        long.select("junction_id").unique().sort("junction_id").with_row_count("junction_idx")
+    )
+    counts = (
+        long.join(junctions, on="junction_id")
+        .select("sample_idx", "junction_idx", "total_count")
+        .sort(["sample_idx", "junction_idx"])
+    )
+    return junctions, samples, counts
+
+
+def write_matrix(matrix, output_dir):
+    os.makedirs(output_dir, exist_ok=True)
+    for name, df in zip([JUNCTIONS, SAMPLES, COUNTS], matrix):
+        df.write_parquet(os.path.join(output_dir, name), statistics=True)
+    matrix[2].sort(["junction_idx", "sample_idx"]).write_parquet(
+        os.path.join(output_dir, COUNTS_BY_JUNCTION), statistics=True
+    )
+
+
+def scan_matrix(matrix_dir):
+    return [pl.scan_parquet(os.path.join(matrix_dir, name)) for name in [JUNCTIONS, SAMPLES, COUNTS]]
+
+
+def sample_counts(matrix_dir, sample_name):
+    # junction_id, total_count of one sample, as returned by filter_exons.parse_ipsa
+    junctions, samples, counts = scan_matrix(matrix_dir)
+    sample_idx = samples.filter(pl.col("sample_name") == sample_name).collect()["sample_idx"]
+    if len(sample_idx) == 0:
+        raise ValueError(f"Sample {sample_name} is not in the junction matrix {matrix_dir}")
+    return (
+        counts.filter(pl.col("sample_idx") == sample_idx[0])
+        .join(junctions, on="junction_idx")
+        .select("junction_id", "total_count")
+        .collect()
+    )
+
+
+def junction_counts(matrix_dir, junction_ids):
+    # long table of the counts of the given junctions in all samples
+    junctions, samples, _ = scan_matrix(matrix_dir)
+    junctions = junctions.filter(pl.col("junction_id").is_in(junction_ids)).collect()
+    idx = junctions["junction_idx"]
+    predicate = pl.col("junction_idx").is_in(idx)
+    if len(idx) > 0:
+        # a range predicate lets the scan skip row groups by their statistics
+        predicate = pl.col("junction_idx").is_between(idx.min(), idx.max()) & predicate
+    counts = pl.scan_parquet(os.path.join(matrix_dir, COUNTS_BY_JUNCTION)).filter(predicate)
+    return (
+        junctions.lazy()
+        .join(counts, on="junction_idx")
+        .join(samples, on="sample_idx")
+        .select("junction_id", "sample_name", "total_count")
+        .sort(["junction_id", "sample_name"])
+        .collect()
+    )
+
+
+def to_scipy(matrix_dir):
+    junctions, samples, counts = [lf.collect() for lf in scan_matrix(matrix_dir)]
+    return csc_matrix(
+        (
+            counts["total_count"].to_numpy(),
+            (counts["junction_idx"].to_numpy(), counts["sample_idx"].to_numpy()),
+        ),
+        shape=(junctions.shape[0], samples.shape[0]),
+    )
+
+
+@click.command()
+@click.option("--matrix-dir", required=True)
+@click.option("--junction-id", "junction_ids", required=True, multiple=True)
+@click.option("--output", default=None)
+def main(matrix_dir, junction_ids, output):
+    df = junction_counts(matrix_dir, list(junction_ids))
+    if output is None:
+        with pl.Config(tbl_rows=-1):
+            print(df)
+    else:
+        df.write_csv(output, separator="\t")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,18 +3,29 @@ import pickle
 import click
 import polars as pl
 
+from workflow.scripts.intermediate_io import IPC_COMPRESSIONS, write_table
+
+# columns of the right element of AL/AR events, empty in samples without them
+RIGHT_DTYPES = {
+    "exon_id_right": pl.Utf8,
+    "cov_right": pl.Float64,
+    "start_right": pl.Int64,
+    "end_right": pl.Int64,
+}
 
 @click.command()
 @click.option("--input-list", required=True)
 @click.option("--output", required=True)
-def main(input_list, output):
+@click.option("--ipc-compression", type=click.Choice(IPC_COMPRESSIONS), default="uncompressed")
+def main(input_list, output, ipc_compression):
     file_list = pl.read_csv(input_list, separator="\t", has_header=False)["column_1"]
-    pl.concat(
-        pl.read_csv(str(t), separator="\t", infer_schema_length=None) for t in file_list
-    ).with_columns(
-        pl.min_horizontal(["ipsa_l", "ipsa_r"]).alias("ipsa_min")
-    ).write_parquet(
-        output
+    write_table(
+        pl.concat(
+            pl.read_csv(str(t), separator="\t", infer_schema_length=None, dtypes=RIGHT_DTYPES)
+            for t in file_list
+        ).with_columns(pl.min_horizontal(["ipsa_l", "ipsa_r"]).alias("ipsa_min")),
+        output,
+        ipc_compression,
     )
 
 
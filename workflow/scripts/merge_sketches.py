@@ -0,0 +1,27 @@
+import click
+import polars as pl
+
+from workflow.scripts.intermediate_io import PARAM_COLUMNS
+from workflow.scripts.quantile_sketch import REFERENCE_GROUPS, reference_sketch
+
+
+@click.command()
+@click.option("--input", "inputs", required=True, multiple=True)
+@click.option("--group-by", type=click.Choice(list(REFERENCE_GROUPS)), default="cohort")
+@click.option("--input-meta", default=None)
+@click.option("--output", required=True)
+def main(inputs, group_by, input_meta, output):
+    sketches = [pl.read_parquet(f) for f in inputs]
+    meta_df = (
+        pl.read_csv(input_meta).select(pl.col("name").alias("sample_name"), "meta")
+        if input_meta is not None
+        else None
+    )
+
+    # sketches of a parameter sweep are merged separately for each combination
+    params = [c for c in PARAM_COLUMNS if c in sketches[0].columns]
+    reference_sketch(sketches, group_by, meta_df, params).write_parquet(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 import click
 import polars as pl
 
+from workflow.scripts.intermediate_io import read_table
+
 
 def get_unique_event_stats(df):
     return (
@@ -35,10 +37,14 @@ def main(
     input_meta,
     output_table,
 ):
-    df5 = pl.read_parquet(input_pq, use_pyarrow=True)
+    df5 = read_table(input_pq)
 
-    df_ann_is = pl.read_csv(input_ann_is, separator='\t', has_header=False, new_columns=['exon_id', 'ann_frac'])
-    df5 = df5.join(df_ann_is, on='exon_id')
+    df_ann_is = pl.read_csv(input_ann_is, separator='\t', has_header=False, new_columns=['exon_id', 'radius', 'ann_frac'])
+    # tables of a parameter sweep have one annotated fraction per radius
+    if 'radius' in df5.columns:
+        df5 = df5.join(df_ann_is, on=['exon_id', 'radius'])
+    else:
+        df5 = df5.join(df_ann_is.drop('radius'), on='exon_id')
 
     print(f"Number of unique events in input DF:")
     print(get_unique_event_stats(df5))
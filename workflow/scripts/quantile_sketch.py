@@ -0,0 +1,166 @@
+import math
+
+import polars as pl
+
+# Log-bucketed mergeable quantile sketch (DDSketch-style). A value v > MIN_VALUE
+# goes to bucket ceil(log_gamma(v)) with gamma = (1 + alpha) / (1 - alpha), so
+# every value in a bucket is within relative error alpha of the bucket value.
+# Values <= MIN_VALUE (zeros) share ZERO_BUCKET. The metrics sketched here are
+# non-negative, negative values would also be put into ZERO_BUCKET.
+# A sketch is a long table [*by, metric, bucket, count, alpha]; merging sketches
+# is a sum of counts over identical buckets.
+
+MIN_VALUE = 1e-9
+ZERO_BUCKET = -(2**31) + 1
+SENTINEL_BUCKET = -(2**31)
+SKETCH_COLUMNS = ["metric", "bucket", "count", "alpha"]
+DEFAULT_ALPHA = 0.01
+REFERENCE_GROUPS = {
+    "sample": ["sample_name", "event_type"],
+    "meta": ["meta", "event_type"],
+    "cohort": ["event_type"],
+}
+
+
+def bucket_index(col, alpha):
+    gamma = (1 + alpha) / (1 - alpha)
+    return (
+        pl.when(pl.col(col) > MIN_VALUE)
+        .then((pl.col(col).log() / math.log(gamma)).ceil())
+        .otherwise(ZERO_BUCKET)
+        .cast(pl.Int32)
+    )
+
+
+def bucket_value(col, alpha):
+    # value within relative error alpha of every value in the bucket
+    gamma = (1 + alpha) / (1 - alpha)
+    return (
+        pl.when(pl.col(col) == ZERO_BUCKET)
+        .then(0.0)
+        .otherwise((pl.col(col) * math.log(gamma)).exp() * 2 / (gamma + 1))
+    )
+
+
+def sketch_groups(sketch):
+    return [c for c in sketch.columns if c not in SKETCH_COLUMNS]
+
+
+def sketch_alpha(sketch):
+    alphas = sketch["alpha"].unique()
+    if len(alphas) != 1:
+        raise ValueError(f"Sketches with different error bounds: {alphas.to_list()}")
+    return alphas[0]
+
+
+def build_sketch(df, by, metrics, alpha=DEFAULT_ALPHA):
+    # counts are UInt32: a cast inside the aggregation keeps polars 0.19.3 from
+    # streaming the group-by over a LazyFrame
+    return (
+        df.select(*by, *[pl.col(k).cast(pl.Float64) for k in metrics])
+        .melt(id_vars=by, value_vars=metrics, variable_name="metric", value_name="value")
+        .filter(pl.col("value").is_not_null() & pl.col("value").is_not_nan())
+        .with_columns(bucket_index("value", alpha).alias("bucket"))
+        .group_by([*by, "metric", "bucket"])
+        .agg(pl.count().alias("count"))
+        .with_columns(pl.lit(alpha, dtype=pl.Float64).alias("alpha"))
+    )
+
+
+def merge_sketches(sketches, by):
+    sketch = pl.concat(
+        [s.with_columns(pl.col("count").cast(pl.Int64)) for s in sketches],
+        how="diagonal",
+    )
+    alpha = sketch_alpha(sketch)
+    return (
+        sketch.group_by([*by, "metric", "bucket"])
+        .agg(pl.sum("count"))
+        .with_columns(pl.lit(alpha, dtype=pl.Float64).alias("alpha"))
+    )
+
+
+def add_meta(df, meta_df):
+    df = df.join(meta_df, on="sample_name", how="left")
+    missing = df.filter(pl.col("meta").is_null())["sample_name"].unique().to_list()
+    if missing:
+        raise ValueError(f"Samples missing from the sample table: {sorted(missing)}")
+    return df
+
+
+def reference_sketch(sketches, reference_by, meta_df=None, params=()):
+    # merge per-sample sketches into per-sample, per-condition or cohort references
+    if reference_by == "meta":
+        sketches = [add_meta(s, meta_df).drop("sample_name") for s in sketches]
+    return merge_sketches(sketches, [*params, *REFERENCE_GROUPS[reference_by]])
+
+
+def sketch_cdf(sketch):
+    # fraction of reference values in buckets <= bucket, with a zero-valued
+    # sentinel below all buckets so that every sketched group matches a query
+    by = [*sketch_groups(sketch), "metric"]
+    ref = (
+        sketch.sort("bucket")
+        .with_columns(
+            (
+                pl.col("count").cumsum().over(by) / pl.col("count").sum().over(by)
+            ).alias("cdf")
+        )
+        .select(*by, "bucket", "cdf")
+    )
+    sentinel = ref.select(by).unique().with_columns(
+        pl.lit(SENTINEL_BUCKET, dtype=pl.Int32).alias("bucket"),
+        pl.lit(0.0, dtype=pl.Float64).alias("cdf"),
+    )
+    return pl.concat([sentinel, ref]).sort("bucket")
+
+
+def sketch_quantile(sketch, q):
+    # mean of the values of rank floor and ceil of q * (n - 1), as median()
+    # for q = 0.5, within relative error alpha of the exact quantile
+    by = [*sketch_groups(sketch), "metric"]
+    alpha = sketch_alpha(sketch)
+    rank = q * (pl.col("n") - 1)
+
+    def bucket_of(rank):
+        return pl.col("bucket").filter(pl.col("rank") >= rank + 1).min()
+
+    return (
+        sketch.sort("bucket")
+        .with_columns(
+            pl.col("count").cumsum().over(by).alias("rank"),
+            pl.col("count").sum().over(by).alias("n"),
+        )
+        .group_by(by)
+        .agg(
+            bucket_of(rank.floor()).alias("lower"),
+            bucket_of(rank.ceil()).alias("upper"),
+        )
+        .with_columns(
+            ((bucket_value("lower", alpha) + bucket_value("upper", alpha)) / 2).alias(
+                "value"
+            )
+        )
+        .drop("lower", "upper")
+    )
+
+
+def evaluate_cdf(df, sketch, metrics, suffix="_ann_cdf", decimals=4):
+    by = sketch_groups(sketch)
+    alpha = sketch_alpha(sketch)
+    ref = sketch_cdf(sketch)
+    df = df.with_row_count("_row")
+    for k in metrics:
+        lookup = (
+            df.select("_row", *by, bucket_index(k, alpha).alias("bucket"))
+            .sort("bucket")
+            .join_asof(
+                ref.filter(pl.col("metric") == k).drop("metric"),
+                on="bucket",
+                by=by,
+                strategy="backward",
+            )
+            .select("_row", pl.col("cdf").round(decimals).alias(f"{k}{suffix}"))
+        )
+        df = df.join(lookup, on="_row", how="left")
+    return df.sort("_row").drop("_row")
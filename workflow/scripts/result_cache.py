@@ -0,0 +1,152 @@
+import fcntl
+import hashlib
+import os
+import shutil
+import subprocess
+
+import click
+
+# Content-addressed cache of rule outputs. The key is a digest of the input
+# and code files (full content for --key-file, size + mtime + first MiB for
+# --key-stat, e.g. BAM files, the counts of one sample for --key-matrix-sample)
+# and free text such as tool versions and flags. Entries are
+# <cache-dir>/<key[:2]>/<key>/data, so outputs with the same key share an
+# entry whatever their names; the least recently used entries are evicted
+# when the cache exceeds its size. Jobs with the same key are serialized by a
+# lock on <key>.lock, so that only the first one runs the command.
+
+CHUNK_SIZE = 2**20
+PAYLOAD = "data"
+
+
+def iter_files(path):
+    if os.path.isdir(path):
+        for root, _, files in sorted(os.walk(path)):
+            for f in sorted(files):
+                yield os.path.join(root, f)
+    else:
+        yield path
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    for f in iter_files(path):
+        with open(f, "rb") as fh:
+            while chunk := fh.read(CHUNK_SIZE):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+def stat_digest(path):
+    st = os.stat(path)
+    h = hashlib.sha256(f"{st.st_size}:{st.st_mtime_ns}".encode())
+    with open(path, "rb") as fh:
+        h.update(fh.read(CHUNK_SIZE))
+    return h.hexdigest()
+
+
+def matrix_sample_digest(matrix_dir, sample_name):
+    # digest of the junction counts of one sample, independent of the other
+    # samples of the junction matrix
+    from workflow.scripts.junction_matrix import sample_counts
+
+    counts = sample_counts(matrix_dir, sample_name).sort("junction_id")
+    return hashlib.sha256(counts.write_csv().encode()).hexdigest()
+
+
+def cache_key(key_files, key_stats, key_matrix_samples, key_texts):
+    h = hashlib.sha256()
+    for f in key_files:
+        h.update(file_digest(f).encode())
+    for f in key_stats:
+        h.update(stat_digest(f).encode())
+    for matrix_dir, sample_name in key_matrix_samples:
+        h.update(matrix_sample_digest(matrix_dir, sample_name).encode())
+    for t in key_texts:
+        h.update(t.encode())
+    return h.hexdigest()
+
+
+def entry_size(entry):
+    return sum(os.path.getsize(f) for f in iter_files(entry))
+
+
+def evict(cache_dir, max_size):
+    entries = [
+        os.path.join(cache_dir, d, k)
+        for d in os.listdir(cache_dir)
+        if os.path.isdir(os.path.join(cache_dir, d))
+        for k in os.listdir(os.path.join(cache_dir, d))
+        if not k.endswith((".tmp", ".lock"))
+    ]
+    entries = sorted(entries, key=os.path.getmtime, reverse=True)
+    total = 0
+    for entry in entries:
+        total += entry_size(entry)
+        if total > max_size:
+            print(f"Evicting {entry}")
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+def fetch(entry, output):
+    cached = os.path.join(entry, PAYLOAD)
+    if not os.path.exists(cached):
+        return False
+    shutil.copyfile(cached, output)
+    # mark as recently used
+    os.utime(entry)
+    return True
+
+
+def store(entry, output):
+    tmp = f"{entry}.{os.getpid()}.tmp"
+    os.makedirs(tmp, exist_ok=True)
+    shutil.copyfile(output, os.path.join(tmp, PAYLOAD))
+    try:
+        os.rename(tmp, entry)
+    except OSError:
+        # stored by a concurrent job with the same key
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+@click.command()
+@click.option("--cache-dir", default="")
+@click.option("--max-size-gb", default=100.0)
+@click.option("--key-file", "key_files", multiple=True)
+@click.option("--key-stat", "key_stats", multiple=True)
+@click.option("--key-matrix-sample", "key_matrix_samples", nargs=2, multiple=True)
+@click.option("--key-text", "key_texts", multiple=True)
+@click.option("--output", required=True)
+@click.option("--command", required=True)
+def main(
+    cache_dir,
+    max_size_gb,
+    key_files,
+    key_stats,
+    key_matrix_samples,
+    key_texts,
+    output,
+    command,
+):
+    if not cache_dir:
+        subprocess.run(command, shell=True, check=True, executable="/bin/bash")
+        return
+
+    key = cache_key(key_files, key_stats, key_matrix_samples, key_texts)
+    entry = os.path.join(cache_dir, key[:2], key)
+    os.makedirs(os.path.dirname(entry), exist_ok=True)
+    with open(f"{entry}.lock", "w") as lock:
+        # a concurrent job with the same key stores the entry before releasing
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if fetch(entry, output):
+            print(f"Cache hit: {entry}")
+            return
+
+        print(f"Cache miss: {entry}")
+        subprocess.run(command, shell=True, check=True, executable="/bin/bash")
+        store(entry, output)
+    evict(cache_dir, max_size_gb * 2**30)
+
+
+if __name__ == "__main__":
+    main()